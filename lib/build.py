@@ -0,0 +1,167 @@
+"""Offline build and verification of plugin release candidates."""
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import zipfile
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from email.parser import Parser
+from functools import partial
+from pathlib import Path
+
+from packaging.requirements import Requirement
+from packaging.utils import canonicalize_name, parse_wheel_filename
+from rich.console import Console
+
+from lib.config import PATH
+from lib.git import stream
+
+console = Console()
+
+BUILD_CACHE = PATH / '.build_cache'
+WHEELHOUSE = PATH / '.wheelhouse'
+BUILD_OUTPUTS = [':(exclude)build', ':(exclude)dist', ':(exclude,glob)**/*.egg-info/**']
+
+
+class WheelhouseError(Exception):
+    """The wheelhouse cannot provide the dependencies of the plugins."""
+
+
+def get_tree_hash(plugin: str) -> str:
+    """Get a hash of the source tree of a plugin, including uncommitted and untracked files but not build outputs."""
+    files_args = ['git', 'ls-files', '-z', '--cached', '--others', '--exclude-standard', '--', '.', *BUILD_OUTPUTS]
+    tree_hash = hashlib.sha256()
+    for file in sorted(set(stream(files_args, cwd=(PATH / plugin)))):
+        path = PATH / plugin / file
+        if path.is_file():
+            tree_hash.update(file.encode() + b'\0')
+            tree_hash.update(hashlib.sha256(path.read_bytes()).digest())
+    return tree_hash.hexdigest()
+
+def get_offline_env(wheelhouse: Path) -> dict:
+    """Get the environment to run pip without network, using the wheelhouse."""
+    return {**os.environ, 'PIP_NO_INDEX': '1', 'PIP_FIND_LINKS': str(wheelhouse), 'PIP_DISABLE_PIP_VERSION_CHECK': '1'}
+
+def build_plugin(plugin: str, wheelhouse: Path = WHEELHOUSE, cache: Path = BUILD_CACHE) -> list[Path]:
+    """Build the sdist and wheel of a plugin without isolation, reusing them if the source did not change."""
+    out_dir = cache / Path(plugin).name / get_tree_hash(plugin)
+    artifacts = sorted([*out_dir.glob('*.whl'), *out_dir.glob('*.tar.gz')])
+    if len(artifacts) == 2:  # noqa: PLR2004
+        return artifacts
+    shutil.rmtree(out_dir, ignore_errors=True)
+    build_args = [sys.executable, '-m', 'build', '--sdist', '--wheel', '--no-isolation', '--outdir', str(out_dir), str(PATH / plugin)]
+    subprocess.check_output(build_args, text=True, stderr=subprocess.STDOUT, env=get_offline_env(wheelhouse)) # noqa: S603
+    return sorted([*out_dir.glob('*.whl'), *out_dir.glob('*.tar.gz')])
+
+def smoke_test(plugin: str, wheel: Path, wheelhouse: Path = WHEELHOUSE, requirements: Iterable[Path] = ()) -> None:
+    """Install a wheel in an isolated throwaway environment from the wheelhouse only and import it.
+
+    The requirement wheels (the fresh datoso build) are installed explicitly alongside it,
+    every other dependency has to be in the wheelhouse.
+    """
+    with tempfile.TemporaryDirectory() as venv:
+        subprocess.check_output([sys.executable, '-m', 'venv', '--without-pip', venv], text=True, stderr=subprocess.STDOUT) # noqa: S603
+        python = str(Path(venv) / 'bin' / 'python')
+        install_args = [sys.executable, '-m', 'pip', '--python', python, 'install', '--no-index', '--find-links', str(wheelhouse),
+                        *map(str, requirements), str(wheel)]
+        subprocess.check_output(install_args, text=True, stderr=subprocess.STDOUT, env=get_offline_env(wheelhouse)) # noqa: S603
+        subprocess.check_output([python, '-c', f'import {Path(plugin).name}'], text=True, stderr=subprocess.STDOUT, cwd=venv) # noqa: S603
+
+def get_wheel_requirements(wheel: Path) -> list[Requirement]:
+    """Get the requirements of a wheel that apply without extras."""
+    with zipfile.ZipFile(wheel) as archive:
+        metadata_file = next(name for name in archive.namelist() if name.endswith('.dist-info/METADATA'))
+        metadata = Parser().parsestr(archive.read(metadata_file).decode())
+    requirements = [Requirement(requirement) for requirement in metadata.get_all('Requires-Dist') or []]
+    return [requirement for requirement in requirements if not requirement.marker or requirement.marker.evaluate({'extra': ''})]
+
+def find_missing_dependencies(wheels: Iterable[Path], wheelhouse: Path = WHEELHOUSE) -> set[str]:
+    """Find the dependencies of the wheels, direct or not, that are neither built nor in the wheelhouse."""
+    wheels = list(wheels)
+    provided = {parse_wheel_filename(wheel.name)[0] for wheel in wheels}
+    available = {parse_wheel_filename(wheel.name)[0]: wheel for wheel in sorted(wheelhouse.glob('*.whl'))}
+    seen, missing = set(), set()
+    while wheels:
+        for requirement in get_wheel_requirements(wheels.pop()):
+            name = canonicalize_name(requirement.name)
+            if name in provided or name in seen:
+                continue
+            seen.add(name)
+            if name in available:
+                wheels.append(available[name])
+            else:
+                missing.add(name)
+    return missing
+
+def get_wheel(result: dict) -> Path | None:
+    """Get the wheel of a build result."""
+    return next((artifact for artifact in result['artifacts'] if artifact.suffix == '.whl'), None)
+
+def run_build(plugin: str, wheelhouse: Path = WHEELHOUSE, cache: Path = BUILD_CACHE) -> dict:
+    """Build a plugin, recording any failure in the result."""
+    result = {'name': plugin, 'artifacts': [], 'error': None}
+    try:
+        result['artifacts'] = build_plugin(plugin, wheelhouse, cache)
+        if get_wheel(result) is None:
+            result['error'] = 'no wheel built'
+    except subprocess.CalledProcessError as e:
+        result['error'] = e.output or str(e)
+    except OSError as e:
+        result['error'] = str(e)
+    return result
+
+def run_smoke_test(result: dict, wheelhouse: Path = WHEELHOUSE, requirements: Iterable[Path] = ()) -> dict:
+    """Run the import smoke test of a built plugin, recording any failure in the result."""
+    try:
+        smoke_test(result['name'], get_wheel(result), wheelhouse, requirements)
+    except subprocess.CalledProcessError as e:
+        result['error'] = e.output or str(e)
+    except OSError as e:
+        result['error'] = str(e)
+    return result
+
+def verify_plugins(plugins: Iterable[str], wheelhouse: Path = WHEELHOUSE, cache: Path = BUILD_CACHE,
+                   max_workers: int | None = None) -> dict[str, dict]:
+    """Build and verify plugins in a process pool.
+
+    Every plugin, datoso included, is built at once. Then the datoso wheel replaces any
+    older one in the wheelhouse and the smoke tests run against it, also at once.
+    Every plugin depends on datoso, so if it fails they all fail.
+    Raises WheelhouseError if the wheelhouse lacks third-party dependencies.
+    """
+    plugins = list(plugins)
+    wheelhouse.mkdir(parents=True, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = {result['name']: result for result in executor.map(partial(run_build, wheelhouse=wheelhouse, cache=cache), plugins)}
+
+        requirements = []
+        if 'datoso' in results:
+            for old_wheel in wheelhouse.glob('datoso-*.whl'):
+                old_wheel.unlink()
+            if results['datoso']['error']:
+                for result in results.values():
+                    if result['name'] != 'datoso':
+                        result['error'] = 'datoso failed to build'
+            else:
+                requirements = [get_wheel(results['datoso'])]
+                shutil.copy2(requirements[0], wheelhouse)
+
+        built = [result for result in results.values() if not result['error']]
+        missing = find_missing_dependencies((get_wheel(result) for result in built), wheelhouse)
+        if missing:
+            msg = (f'Wheelhouse {wheelhouse} is missing dependencies: {", ".join(sorted(missing))}. '
+                   f'Fill it with: pip wheel --wheel-dir {wheelhouse} {" ".join(sorted(missing))}')
+            raise WheelhouseError(msg)
+
+        for result in executor.map(partial(run_smoke_test, wheelhouse=wheelhouse, requirements=requirements), built):
+            results[result['name']] = result
+    for result in results.values():
+        if result['error']:
+            console.print(f'[red]Build failed for [cyan]{result["name"]}[/cyan][/red]')
+            console.print(result['error'], markup=False, highlight=False)
+        else:
+            console.print(f'[green]Built and verified [cyan]{result["name"]}[/cyan][/green]')
+    return results
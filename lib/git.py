@@ -1,14 +1,38 @@
 """Git helpers."""
+import os
+import re
 import subprocess
+import tempfile
+from collections import Counter
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import suppress
+from enum import Enum
 from pathlib import Path
 
 from rich.console import Console
 
+from lib import simulation
 from lib.config import PATH
 
 console = Console()
 
+VERSION_LINE = re.compile(r'''^\s*__version__\s*=\s*['"][^'"]*['"]\s*$''')
+PROJECT_VERSION_LINE = re.compile(r'''^\s*version\s*=\s*['"][^'"]*['"]\s*$''')
+DEPENDENCY_LINE = re.compile(r'''^\s*([\w-]+\s*=\s*\[\s*)?"(?P<name>[\w.\-]+)(\[[^\]]*\])?\s*[<>=!~]=?[^"]*"\s*\]?\s*,?\s*$''')
+
+
+remote_refs_cache: dict[tuple[str, str], dict[str, str]] = {}
+
+
+class Change(Enum):
+    """Kind of change in a plugin working tree."""
+
+    UNTOUCHED = 'untouched'
+    VERSION_ONLY = 'version-only'
+    DEPENDENCY_ONLY = 'dependency-only'
+    SUBSTANTIVE = 'substantive'
+
 
 def execute(args: list[str], *,  # noqa: PLR0913
             cwd: str | None=None, text: bool=True,
@@ -16,6 +40,10 @@ def execute(args: list[str], *,  # noqa: PLR0913
             safe: bool=True,
             dry_run: bool=False) -> str:
     """Execute a command."""
+    if simulation.current is not None:
+        output = simulation.current.execute(args, cwd=cwd, safe=safe)
+        if output is not None:
+            return output
     if not dry_run or safe:
         return subprocess.check_output(args, cwd=cwd, text=text, stderr=stderr) # noqa: S603
     console.print(f'[yellow]Dry run:[/yellow] [cyan]{" ".join(args)}[/cyan]')
@@ -23,6 +51,34 @@ def execute(args: list[str], *,  # noqa: PLR0913
         console.print(f'[yellow]CWD:[/yellow] [cyan]{cwd}[/cyan]')
     return ''
 
+def stream(args: list[str], *,
+           cwd: str | None=None,
+           separator: bytes=b'\0',
+           chunk_size: int=64 * 1024) -> Iterator[str]:
+    """Execute a command and yield its output records as they arrive.
+
+    Output is read in chunks of ``chunk_size`` bytes and split on ``separator``,
+    so only the current chunk and a partial record are kept in memory.
+    Use with ``-z`` git commands to get paths verbatim (no quoting or escaping).
+    """
+    with tempfile.TemporaryFile() as stderr, \
+         subprocess.Popen(args, cwd=cwd, stdout=subprocess.PIPE, stderr=stderr) as process: # noqa: S603
+        try:
+            pending = b''
+            while chunk := process.stdout.read1(chunk_size):
+                *records, pending = (pending + chunk).split(separator)
+                for record in records:
+                    if record:
+                        yield os.fsdecode(record)
+        except GeneratorExit:
+            process.kill()
+            raise
+        if pending:
+            yield os.fsdecode(pending)
+        if process.wait():
+            stderr.seek(0)
+            raise subprocess.CalledProcessError(process.returncode, args, stderr=stderr.read().decode(errors='replace'))
+
 def get_repo_root() -> str:
     """Get the root directory of the git repository."""
     repo_root_args = ['git', 'rev-parse', '--show-toplevel']
@@ -38,28 +94,48 @@ def remove_duplicates(lst: list) -> list:
     return list(dict.fromkeys(lst))
 
 """ Git helpers file functions """
+def iter_new_files(plugin: str) -> Iterator[str]:
+    """Iterate over new files."""
+    newfiles_args = ['git', 'ls-files', '-z', '--others', '--exclude-standard']
+    return stream(newfiles_args, cwd=(PATH / plugin))
+
+def iter_staged_files(plugin: str) -> Iterator[str]:
+    """Iterate over staged files."""
+    staged_args = ['git', 'diff', '-z', '--cached', '--name-only']
+    return stream(staged_args, cwd=(PATH / plugin))
+
+def iter_modified_files(plugin: str) -> Iterator[str]:
+    """Iterate over modified files."""
+    # args_updatedfiles = ["git", "ls-files", "--modified"] # noqa: ERA001
+    modified_args = ['git', 'diff', '-z', 'HEAD', '--name-only']
+    if simulation.current is not None:
+        return simulation.current.get_modified_files(PATH / plugin, stream(modified_args, cwd=(PATH / plugin)))
+    return stream(modified_args, cwd=(PATH / plugin))
+
+def iter_all_files(plugin: str) -> Iterator[str]:
+    """Iterate over staged, modified and new files, without duplicates."""
+    seen = set()
+    for iterator in (iter_staged_files, iter_modified_files, iter_new_files):
+        for file in iterator(plugin):
+            if file not in seen:
+                seen.add(file)
+                yield file
+
 def get_new_files(plugin: str) -> list:
     """Get new files."""
-    newfiles_args = ['git', 'ls-files', '--others', '--exclude-standard']
-    return [x for x in execute(newfiles_args, cwd=(PATH / plugin)).split('\n') if x]
+    return list(iter_new_files(plugin))
 
 def get_staged_files(plugin: str) -> list:
     """Get staged files."""
-    staged_args = ['git', 'diff', '--cached', '--name-only']
-    return [x for x in execute(staged_args, cwd=(PATH / plugin)).split('\n') if x]
+    return list(iter_staged_files(plugin))
 
 def get_modified_files(plugin: str) -> list:
     """Get modified files."""
-    # args_updatedfiles = ["git", "ls-files", "--modified"] # noqa: ERA001
-    modified_args = ['git', 'diff', 'HEAD', '--name-only']
-    return [x for x in execute(modified_args, cwd=(PATH / plugin)).split('\n') if x]
+    return list(iter_modified_files(plugin))
 
 def get_all_files(plugin: str) -> list:
     """Get modified files."""
-    staged = get_staged_files(plugin)
-    modified = get_modified_files(plugin)
-    newfiles = get_new_files(plugin)
-    return remove_duplicates(staged + modified + newfiles)
+    return list(iter_all_files(plugin))
 
 """ Git helpers branch functions """
 def get_branch(plugin: str) -> str:
@@ -76,12 +152,42 @@ def branch_exists(plugin: str, branch: str) -> bool:
         return True
 
 
-def create_branch(plugin: str, branch: str, *, dry_run: bool) -> None:
-    """Create a branch."""
-    execute(['git', 'checkout', 'master'], cwd=(PATH / plugin), safe=False, dry_run=dry_run)
+def create_branch(plugin: str, branch: str, *, dry_run: bool = False) -> bool:
+    """Create a branch, starting from the remote one if it was already pushed.
+
+    Uncommitted changes are stashed and applied on top of the remote branch. If they
+    do not apply cleanly the plugin is left on master with its changes and False is returned.
+    """
+    cwd = PATH / plugin
+    execute(['git', 'checkout', 'master'], cwd=cwd, safe=False, dry_run=dry_run)
     if check_if_branch_exists(plugin, branch):
         delete_branch(plugin, branch, dry_run=dry_run)  # Ensure branch is deleted if it exists
-    execute(['git', 'checkout', '-b', branch], cwd=(PATH / plugin), safe=False, dry_run=dry_run)
+    if not check_if_remote_branch_exists(plugin, branch):
+        execute(['git', 'checkout', '-b', branch], cwd=cwd, safe=False, dry_run=dry_run)
+        return True
+    console.print(f'[yellow]Branch [cyan]{branch}[/cyan] already exists on remote, starting from it[/yellow]')
+    execute(['git', 'fetch', 'origin', branch], cwd=cwd, safe=False, dry_run=dry_run)
+    stashed = next(iter_modified_files(plugin), None) is not None
+    if stashed:
+        execute(['git', 'stash', 'push', '-m', f'datoso_dev_updater {branch}'], cwd=cwd, safe=False, dry_run=dry_run)
+    try:
+        execute(['git', 'checkout', '-b', branch, '--track', f'origin/{branch}'], cwd=cwd, safe=False, dry_run=dry_run)
+        if stashed:
+            execute(['git', 'stash', 'apply'], cwd=cwd, safe=False, dry_run=dry_run)
+    except subprocess.CalledProcessError as e:
+        console.print(f'[red]Could not carry the changes of [cyan]{plugin}[/cyan] to [cyan]origin/{branch}[/cyan], '
+                      f'leaving them on master[/red]')
+        console.print(e.output, markup=False, highlight=False)
+        execute(['git', 'reset', '--hard'], cwd=cwd, safe=False, dry_run=dry_run)
+        execute(['git', 'checkout', 'master'], cwd=cwd, safe=False, dry_run=dry_run)
+        if check_if_branch_exists(plugin, branch):
+            delete_branch(plugin, branch, dry_run=dry_run)
+        if stashed:
+            execute(['git', 'stash', 'pop'], cwd=cwd, safe=False, dry_run=dry_run)
+        return False
+    if stashed:
+        execute(['git', 'stash', 'drop'], cwd=cwd, safe=False, dry_run=dry_run)
+    return True
 
 def switch_branch(plugin: str, branch: str, *, dry_run: bool = False) -> None:
     """Checkout a branch."""
@@ -100,10 +206,63 @@ def check_if_branch_exists(plugin: str, branch: str) -> bool:
     else:
         return True
 
+""" Git helpers remote functions """
+def get_remote_refs(plugin: str, remote: str = 'origin') -> dict[str, str]:
+    """Get the branches and tags of a remote, cached for the rest of the run.
+
+    Annotated tags are resolved to the commit they point to.
+    A plugin without that remote has no remote refs, any other failure is raised.
+    """
+    key = (str(PATH / plugin), remote)
+    if key in remote_refs_cache:
+        return remote_refs_cache[key]
+    refs = {}
+    try:
+        execute(['git', 'remote', 'get-url', remote], cwd=(PATH / plugin))
+    except subprocess.CalledProcessError:
+        remote_refs_cache[key] = refs
+        return refs
+    for line in stream(['git', 'ls-remote', '--heads', '--tags', remote], cwd=(PATH / plugin), separator=b'\n'):
+        sha, ref = line.split('\t', 1)
+        refs[ref.removesuffix('^{}')] = sha
+    remote_refs_cache[key] = refs
+    return refs
+
+def fetch_remote_refs(plugins: Iterable[str], remote: str = 'origin', max_workers: int | None = None) -> None:
+    """Query the remote refs of several plugins concurrently and cache them.
+
+    A failing remote is reported and left uncached, so it only fails for its own plugin when queried again.
+    """
+    def fetch(plugin: str) -> None:
+        try:
+            get_remote_refs(plugin, remote)
+        except subprocess.CalledProcessError as e:
+            console.print(f'[red]Could not query remote [cyan]{remote}[/cyan] of [cyan]{plugin}[/cyan][/red]')
+            console.print(e.stderr, markup=False, highlight=False)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(fetch, plugins))
+
+def clear_remote_refs_cache() -> None:
+    """Forget the cached remote refs."""
+    remote_refs_cache.clear()
+
+def check_if_remote_branch_exists(plugin: str, branch: str, remote: str = 'origin') -> bool:
+    """Check if a branch exists on the remote."""
+    return f'refs/heads/{branch}' in get_remote_refs(plugin, remote)
+
+def check_if_remote_tag_exists(plugin: str, tag: str, remote: str = 'origin') -> bool:
+    """Check if a tag exists on the remote."""
+    return f'refs/tags/{tag}' in get_remote_refs(plugin, remote)
+
+def get_remote_tags(plugin: str, remote: str = 'origin') -> list[str]:
+    """Get the tags of the remote."""
+    return [ref.removeprefix('refs/tags/') for ref in get_remote_refs(plugin, remote) if ref.startswith('refs/tags/')]
+
 def add_files_to_stage(plugin: str, *, dry_run: bool = False) -> None:
     """Stage files."""
     args = ['git', 'add']
-    files = get_all_files(plugin, dry_run=dry_run)
+    files = get_all_files(plugin)
     for file in files:
         args.append(file) # noqa: PERF402
     print(f'Adding files to stage: {files}')
@@ -117,11 +276,15 @@ def commit_all(plugin: str, message: str, *, dry_run: bool = False) -> None:
 
 
 """ Git helpers python project functions """
+def get_version_files(plugin: str) -> list[str]:
+    """Get the files holding the version and dependencies of a plugin."""
+    return ['pyproject.toml', str(Path('src') / plugin / '__init__.py')]
+
 def undo_update(plugin: str, *, dry_run: bool = False) -> None:
     """Undo the update of a plugin."""
     staged = get_staged_files(plugin)
     modified = get_modified_files(plugin)
-    version_files = ['pyproject.toml', str(Path('src') / plugin / '__init__.py')]
+    version_files = get_version_files(plugin)
     console.print(f'[magenta]Undoing update for [cyan]{plugin}[/cyan][/magenta]')
     console.print(f'Staged files: [yellow]{staged}[/yellow]')
     console.print(f'Modified files: [yellow]{modified}[/yellow]')
@@ -137,16 +300,74 @@ def undo_update(plugin: str, *, dry_run: bool = False) -> None:
                 execute(args, cwd=(PATH / plugin), safe=False, dry_run=dry_run)
     execute(['git', 'checkout', 'master'], cwd=(PATH / plugin), safe=False, dry_run=dry_run)
 
-def check_if_update_needed(plugin: str) -> None:
+def check_if_update_needed(plugin: str) -> bool:
     """Check if an update is needed."""
-    args = ['git', 'diff', 'HEAD', '--name-only']
-    output = execute(args, cwd=(PATH / plugin))
-    updated_files = []
-    init = False
-    for filename in output.split('\n'):
-        if filename.startswith('src/') and filename.endswith('__init__.py'):
-            init = True
+    return any(filename.startswith('src/') and filename.endswith('__init__.py')
+               for filename in iter_modified_files(plugin))
+
+def iter_diff_lines(plugin: str, files: list[str]) -> Iterator[tuple[str, str]]:
+    """Iterate over the files and added or removed lines of a diff against HEAD, without context."""
+    in_hunk = False
+    filename = None
+    hunk_args = ['git', 'diff', '-U0', '--no-color', '--no-renames', 'HEAD', '--', *files]
+    for line in stream(hunk_args, cwd=(PATH / plugin), separator=b'\n'):
+        if line.startswith('diff '):
+            in_hunk = False
+        elif line.startswith('@@'):
+            in_hunk = True
+        elif in_hunk and line[:1] in ('+', '-'):
+            yield filename, line
+        elif line.startswith(('--- a/', '+++ b/')):
+            filename = line[6:]
+
+def classify_changes(plugin: str) -> Change:
+    """Classify the uncommitted changes of a plugin.
+
+    Any new file, binary change or change outside the version files is substantive.
+    Otherwise the diff hunks are scanned line by line: version assignments (__version__ in
+    the package, version in pyproject.toml) only give VERSION_ONLY, requirements in
+    pyproject.toml whose specifier changed (with or without a version bump)
+    give DEPENDENCY_ONLY. An added or removed requirement is substantive.
+    """
+    if next(iter_new_files(plugin), None) is not None:
+        return Change.SUBSTANTIVE
+    version_files = get_version_files(plugin)
+    if simulation.current is not None:
+        changed = list(iter_modified_files(plugin))
+        if any(filename not in version_files for filename in changed):
+            return Change.SUBSTANTIVE
+        lines = simulation.current.get_diff_lines(PATH / plugin, changed)
+    else:
+        changed = []
+        for record in stream(['git', 'diff', '-z', '--numstat', '--no-renames', 'HEAD'], cwd=(PATH / plugin)):
+            added, deleted, filename = record.split('\t', 2)
+            if filename not in version_files or '-' in (added, deleted):
+                return Change.SUBSTANTIVE
+            changed.append(filename)
+        lines = iter_diff_lines(plugin, changed)
+    if not changed:
+        return Change.UNTOUCHED
+
+    requirements = {'+': Counter(), '-': Counter()}
+    for filename, line in lines:
+        content = line[1:]
+        if not content.strip():
+            continue
+        if filename == 'pyproject.toml':
+            if PROJECT_VERSION_LINE.match(content):
+                continue
+            if match := DEPENDENCY_LINE.match(content):
+                requirements[line[0]][re.sub(r'[-_.]+', '-', match['name']).lower()] += 1
+                continue
+        elif VERSION_LINE.match(content):
             continue
-        updated_files.append(filename)
+        return Change.SUBSTANTIVE
+    if requirements['+'] != requirements['-']:
+        return Change.SUBSTANTIVE
+    return Change.DEPENDENCY_ONLY if requirements['+'] else Change.VERSION_ONLY
 
-    return updated_files and init
+def classify_plugins(plugins: Iterable[str], max_workers: int | None = None) -> dict[str, Change]:
+    """Classify the uncommitted changes of several plugins concurrently."""
+    plugins = list(plugins)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(plugins, executor.map(classify_changes, plugins), strict=True))
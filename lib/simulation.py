@@ -0,0 +1,187 @@
+"""In-memory simulation of file edits and git operations for dry runs."""
+import difflib
+import io
+import os
+import subprocess
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+from rich.console import Console
+
+from lib.config import PATH
+
+console = Console()
+
+current = None
+
+
+class Simulation:
+    """Overlay of edited files and virtual ref map of each repository.
+
+    Read-only commands still run on the real repositories, commands that would
+    change them are applied to the virtual refs and recorded instead.
+    """
+
+    def __init__(self) -> None:
+        """Start an empty simulation."""
+        self.files: dict[Path, str] = {}
+        self.repos: dict[str, dict] = {}
+        self.operations: list[tuple[str, list[str]]] = []
+        self.commits = 0
+
+    def read_text(self, path: Path) -> str:
+        """Read a file from the overlay, falling back to disk."""
+        path = Path(path).resolve()
+        if path in self.files:
+            return self.files[path]
+        return path.read_text()
+
+    def write_text(self, path: Path, data: str) -> None:
+        """Write a file to the overlay."""
+        self.files[Path(path).resolve()] = data
+
+    def get_modified_files(self, repo: Path, files: Iterator[str]) -> Iterator[str]:
+        """Merge the overlay files of a repository into its modified files on disk."""
+        repo = Path(repo).resolve()
+        overlay = {path.relative_to(repo).as_posix(): data for path, data in self.files.items() if path.is_relative_to(repo)}
+        for file in files:
+            if file not in overlay:
+                yield file
+        for file, data in overlay.items():
+            try:
+                head_file = subprocess.check_output(['git', 'show', f'HEAD:{file}'], cwd=repo, text=True, # noqa: S603, S607
+                                                    stderr=subprocess.DEVNULL)
+            except subprocess.CalledProcessError:
+                head_file = None
+            if data != head_file:
+                yield file
+
+    def get_diff_lines(self, repo: Path, files: list[str]) -> Iterator[tuple[str, str]]:
+        """Iterate over the files and added or removed lines of a diff against HEAD, without context."""
+        repo = Path(repo).resolve()
+        for file in files:
+            try:
+                head_file = subprocess.check_output(['git', 'show', f'HEAD:{file}'], cwd=repo, text=True, # noqa: S603, S607
+                                                    stderr=subprocess.DEVNULL)
+            except subprocess.CalledProcessError:
+                head_file = ''
+            path = repo / file
+            data = self.read_text(path) if path in self.files or path.exists() else ''  # deleted file
+            diff = difflib.unified_diff(io.StringIO(head_file).readlines(), io.StringIO(data).readlines(), n=0)
+            for line in diff:
+                if line[:1] in ('+', '-') and not line.startswith(('+++', '---')):
+                    yield file, line.rstrip('\n')
+
+    def get_repo(self, cwd: str | None) -> dict:
+        """Get the virtual state of a repository, loading it from disk the first time."""
+        cwd = str(Path(cwd or os.getcwd()).resolve())
+        if cwd not in self.repos:
+            heads = subprocess.check_output(['git', 'for-each-ref', '--format=%(objectname) %(refname:short)', 'refs/heads'], # noqa: S603, S607
+                                            cwd=cwd, text=True)
+            head = subprocess.check_output(['git', 'rev-parse', '--abbrev-ref', 'HEAD'], cwd=cwd, text=True).strip() # noqa: S603, S607
+            refs = {ref: sha for sha, ref in (line.split(' ', 1) for line in heads.splitlines())}
+            self.repos[cwd] = {'path': cwd, 'head': head, 'refs': refs, 'initial_head': head, 'initial_refs': dict(refs)}
+        return self.repos[cwd]
+
+    def execute(self, args: list[str], *, cwd: str | None = None, safe: bool = True) -> str | None:  # noqa: C901, PLR0911, PLR0912
+        """Execute a command against the simulation.
+
+        Returns None when the command should run for real.
+        """
+        if args[:1] != ['git']:
+            if safe:
+                return None
+            self.operations.append((str(cwd or os.getcwd()), args))
+            return ''
+        command, *params = args[1:]
+        if command == 'rev-parse' and params == ['--abbrev-ref', 'HEAD']:
+            return self.get_repo(cwd)['head'] + '\n'
+        if command == 'show-ref' and params[:1] == ['--verify']:
+            branch = params[1].removeprefix('refs/heads/')
+            refs = self.get_repo(cwd)['refs']
+            if branch not in refs:
+                raise subprocess.CalledProcessError(128, args)
+            return f'{refs[branch]} refs/heads/{branch}\n'
+        if command not in ('checkout', 'branch', 'fetch', 'restore', 'add', 'commit', 'push', 'stash', 'reset'):
+            return None
+
+        repo = self.get_repo(cwd)
+        refs = repo['refs']
+        if command == 'checkout' and params[:1] == ['-b']:
+            start = params[-1] if '--track' in params else repo['head']
+            refs[params[1]] = refs.get(start, start)
+            repo['head'] = params[1]
+        elif command == 'checkout':
+            if params[0] not in refs:
+                raise subprocess.CalledProcessError(1, args)
+            repo['head'] = params[0]
+        elif command == 'branch' and params[:1] == ['-D']:
+            if params[1] not in refs:
+                raise subprocess.CalledProcessError(1, args)
+            del refs[params[1]]
+        elif command == 'restore' and '--cached' not in params:
+            for file in params:
+                head_file = subprocess.check_output(['git', 'show', f'HEAD:{file}'], cwd=repo['path'], text=True) # noqa: S603, S607
+                self.write_text(Path(repo['path']) / file, head_file)
+        elif command == 'commit':
+            self.commits += 1
+            refs[repo['head']] = f'simulated-commit-{self.commits}'
+        self.operations.append((repo['path'], args))
+        return ''
+
+    def get_diffs(self) -> Iterator[str]:
+        """Get the unified diffs of the overlay against disk, with paths relative to the plugins directory."""
+        root = PATH.resolve()
+        for path, data in sorted(self.files.items()):
+            original = path.read_text() if path.exists() else ''
+            name = (path.relative_to(root) if path.is_relative_to(root) else path.relative_to(path.anchor)).as_posix()
+            yield from difflib.unified_diff(io.StringIO(original).readlines(), io.StringIO(data).readlines(),
+                                            fromfile=f'a/{name}', tofile=f'b/{name}')
+
+    def get_ref_changes(self) -> Iterator[str]:
+        """Get the ref changes of every repository."""
+        for path, repo in sorted(self.repos.items()):
+            refs, initial_refs = repo['refs'], repo['initial_refs']
+            for branch in sorted(refs.keys() | initial_refs.keys()):
+                if branch not in initial_refs:
+                    yield f'{path}: create {branch} at {refs[branch]}'
+                elif branch not in refs:
+                    yield f'{path}: delete {branch} (was {initial_refs[branch]})'
+                elif refs[branch] != initial_refs[branch]:
+                    yield f'{path}: move {branch} from {initial_refs[branch]} to {refs[branch]}'
+            if repo['head'] != repo['initial_head']:
+                yield f'{path}: HEAD {repo["initial_head"]} -> {repo["head"]}'
+
+    def print_report(self) -> None:
+        """Print the diffs and ref changes of the simulation."""
+        console.print('[yellow]Dry run:[/yellow] [magenta]File changes[/magenta]')
+        for line in self.get_diffs():
+            console.print(line, end='' if line.endswith('\n') else '\n', markup=False, highlight=False)
+        console.print('[yellow]Dry run:[/yellow] [magenta]Ref changes[/magenta]')
+        for line in self.get_ref_changes():
+            console.print(line, markup=False, highlight=False)
+
+
+@contextmanager
+def simulate() -> Iterator[Simulation]:
+    """Run the enclosed code against a new simulation."""
+    global current  # noqa: PLW0603
+    previous, current = current, Simulation()
+    try:
+        yield current
+    finally:
+        current = previous
+
+def read_text(path: Path) -> str:
+    """Read a file, from the simulation overlay if one is running."""
+    if current is not None:
+        return current.read_text(path)
+    return Path(path).read_text()
+
+def write_text(path: Path, data: str) -> None:
+    """Write a file, to the simulation overlay if one is running."""
+    if current is not None:
+        current.write_text(path, data)
+    else:
+        Path(path).write_text(data)
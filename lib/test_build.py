@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Test build."""
+
+import pytest
+
+from lib.build import WheelhouseError, build_plugin, get_tree_hash, verify_plugins
+from lib.git import execute
+
+pytest.importorskip('build')
+
+
+def create_plugin(plugin_dir, dependencies: str = '') -> None:
+    """Create a minimal plugin repository."""
+    name = plugin_dir.name
+    (plugin_dir / 'src' / name).mkdir(parents=True)
+    (plugin_dir / 'pyproject.toml').write_text(
+        '[build-system]\nrequires = ["setuptools"]\nbuild-backend = "setuptools.build_meta"\n\n'
+        f'[project]\nname = "{name.replace("_", "-")}"\nversion = "1.0.0"\ndependencies = [{dependencies}]\n',
+    )
+    (plugin_dir / 'src' / name / '__init__.py').write_text("__version__ = '1.0.0'\n")
+    execute(['git', 'init'], cwd=plugin_dir)
+
+@pytest.fixture
+def plugin(tmp_path):
+    """Create a minimal plugin repository."""
+    plugin_dir = tmp_path / 'datoso_seed_test'
+    create_plugin(plugin_dir)
+    return plugin_dir
+
+def test_get_tree_hash(plugin):
+    """Test get_tree_hash."""
+    tree_hash = get_tree_hash(plugin)
+    assert get_tree_hash(plugin) == tree_hash
+    (plugin / 'src' / 'datoso_seed_test' / '__init__.py').write_text("__version__ = '1.0.1'\n")
+    assert get_tree_hash(plugin) != tree_hash
+
+def test_verify_plugins(plugin, tmp_path):
+    """Test verify_plugins."""
+    wheelhouse, cache = tmp_path / 'wheelhouse', tmp_path / 'cache'
+    results = verify_plugins([plugin], wheelhouse=wheelhouse, cache=cache)
+    assert results[plugin]['error'] is None
+    artifacts = results[plugin]['artifacts']
+    assert sorted(artifact.suffix for artifact in artifacts) == ['.gz', '.whl']
+
+    mtimes = [artifact.stat().st_mtime_ns for artifact in artifacts]
+    assert build_plugin(plugin, wheelhouse, cache) == artifacts
+    assert [artifact.stat().st_mtime_ns for artifact in artifacts] == mtimes
+
+    (plugin / 'src' / 'datoso_seed_test' / '__init__.py').write_text('raise ImportError\n')
+    assert verify_plugins([plugin], wheelhouse=wheelhouse, cache=cache)[plugin]['error']
+
+def test_verify_plugins_missing_dependencies(plugin, tmp_path):
+    """Test verify_plugins reports dependencies missing from the wheelhouse, even if installed on the host."""
+    pyproject = plugin / 'pyproject.toml'
+    pyproject.write_text(pyproject.read_text().replace('dependencies = []', 'dependencies = ["rich"]'))
+    with pytest.raises(WheelhouseError, match='rich'):
+        verify_plugins([plugin], wheelhouse=tmp_path / 'wheelhouse', cache=tmp_path / 'cache')
+
+def test_verify_plugins_missing(tmp_path):
+    """Test verify_plugins reports a missing plugin instead of raising."""
+    missing = tmp_path / 'datoso_seed_missing'
+    results = verify_plugins([missing], wheelhouse=tmp_path / 'wheelhouse', cache=tmp_path / 'cache')
+    assert results[missing]['error']
+
+def test_verify_plugins_wheelhouse(plugin, tmp_path):
+    """Test verify_plugins installs dependencies from the wheelhouse."""
+    wheelhouse, cache = tmp_path / 'wheelhouse', tmp_path / 'cache'
+    create_plugin(tmp_path / 'datoso_seed_dependency')
+    wheelhouse.mkdir()
+    for artifact in build_plugin(tmp_path / 'datoso_seed_dependency', wheelhouse, cache):
+        if artifact.suffix == '.whl':
+            artifact.rename(wheelhouse / artifact.name)
+    pyproject = plugin / 'pyproject.toml'
+    pyproject.write_text(pyproject.read_text().replace('dependencies = []', 'dependencies = ["datoso-seed-dependency>=1.0"]'))
+    assert verify_plugins([plugin], wheelhouse=wheelhouse, cache=cache)[plugin]['error'] is None
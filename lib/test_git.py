@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
 """Test git."""
 
+import subprocess
+
 import pytest
 
 from lib import git
-from lib.git import switch_branch, commit_all, delete_branch, execute, get_new_files, get_staged_files, get_all_files, get_modified_files, get_branch, create_branch, check_if_branch_exists, add_files_to_stage, undo_update, check_if_update_needed
+from lib.git import switch_branch, commit_all, delete_branch, execute, stream, iter_new_files, get_new_files, get_staged_files, get_all_files, get_modified_files, get_branch, create_branch, check_if_branch_exists, add_files_to_stage, undo_update, check_if_update_needed, Change, classify_changes, classify_plugins, clear_remote_refs_cache, check_if_remote_branch_exists, check_if_remote_tag_exists, fetch_remote_refs, get_remote_tags
 
 from lib.config import PATH
+from lib.plugins import get_plugin_version, update_version
+from lib.simulation import simulate
 
 
 GIT_DIR = 'datoso_dev_updater/test_git'
@@ -45,6 +49,20 @@ def test_execute():
     assert execute(['ls', '-la'], safe=True) != ''
     git.dry_run = False
 
+def test_stream():
+    """Test stream."""
+    assert list(stream(['printf', 'a\\0b\\nc\\0\\0d'])) == ['a', 'b\nc', 'd']
+    assert list(stream(['printf', 'a\\nb\\n'], separator=b'\n', chunk_size=1)) == ['a', 'b']
+    with pytest.raises(subprocess.CalledProcessError):
+        list(stream(['git', 'rev-parse', 'does-not-exist'], cwd=GIT_TEST_DIR))
+
+def test_iter_new_files():
+    """Test iter_new_files."""
+    create_file(GIT_TEST_DIR / 'line\nbreak "quoted"', 'test')
+    files = iter_new_files(GIT_TEST_DIR)
+    assert not isinstance(files, list)
+    assert list(files) == ['line\nbreak "quoted"']
+
 def test_get_new_files():
     """Test get_new_files."""
     assert get_new_files(GIT_TEST_DIR) == []
@@ -150,3 +168,195 @@ def test_check_if_update_needed():
     assert not check_if_update_needed(GIT_TEST_DIR)
     create_file(GIT_TEST_DIR / 'src' / 'datoso_dev_updater' / 'test_git' / '__init__.py', 'new_test')
     assert check_if_update_needed(GIT_TEST_DIR)
+
+def create_project(version: str, dependency: str, code: str = '', extra: str = '') -> None:
+    """Create the version files of a project."""
+    (GIT_TEST_DIR / 'src' / 'datoso_dev_updater' / 'test_git').mkdir(parents=True, exist_ok=True)
+    create_file(GIT_TEST_DIR / 'pyproject.toml', f'[project]\nversion = "{version}"\ndependencies = [\n    "datoso>={dependency}",\n{extra}]\n')
+    create_file(GIT_TEST_DIR / 'src' / 'datoso_dev_updater' / 'test_git' / '__init__.py', f"{code}__version__ = '{version}'\n")
+
+def test_classify_changes():
+    """Test classify_changes."""
+    create_project('1.0.0', '1.0.0')
+    add_files_to_stage(GIT_TEST_DIR)
+    commit_all(GIT_TEST_DIR, 'Test commit')
+    assert classify_changes(GIT_DIR) == Change.UNTOUCHED
+
+    create_project('1.0.1', '1.0.0')
+    assert classify_changes(GIT_DIR) == Change.VERSION_ONLY
+
+    create_project('1.0.1', '1.1.0')
+    assert classify_changes(GIT_DIR) == Change.DEPENDENCY_ONLY
+
+    create_project('1.0.1', '1.1.0', code='import os\n')
+    assert classify_changes(GIT_DIR) == Change.SUBSTANTIVE
+
+    create_project('1.0.0', '1.0.0', extra='    "requests>=2.0",\n')
+    assert classify_changes(GIT_DIR) == Change.SUBSTANTIVE
+
+    create_project('1.0.1', '1.1.0', extra='    "requests>=2.0",\n')
+    assert classify_changes(GIT_DIR) == Change.SUBSTANTIVE
+
+    create_project('1.0.0', '1.0.0', code='version = "2.0"\n')
+    assert classify_changes(GIT_DIR) == Change.SUBSTANTIVE
+
+    create_project('1.0.0', '1.0.0', code='__all__ = [\n    "requests>=2.0",\n]\n')
+    assert classify_changes(GIT_DIR) == Change.SUBSTANTIVE
+
+    create_project('1.0.0', '1.0.0')
+    create_file(GIT_TEST_DIR / 'initial_file', 'another_test')
+    assert classify_changes(GIT_DIR) == Change.SUBSTANTIVE
+
+    execute(['git', 'checkout', 'initial_file'], cwd=GIT_TEST_DIR)
+    create_file(GIT_TEST_DIR / 'test_file', 'test')
+    assert classify_plugins([GIT_DIR]) == {GIT_DIR: Change.SUBSTANTIVE}
+
+def create_remote(path) -> None:
+    """Create a bare repository and use it as origin."""
+    execute(['git', 'init', '--bare', str(path)])
+    execute(['git', 'remote', 'add', 'origin', str(path)], cwd=GIT_TEST_DIR)
+    execute(['git', 'push', 'origin', 'master'], cwd=GIT_TEST_DIR)
+    clear_remote_refs_cache()
+
+def test_remote_refs(tmp_path):
+    """Test remote refs queries."""
+    assert not check_if_remote_branch_exists(GIT_TEST_DIR, 'master')
+    create_remote(tmp_path / 'remote.git')
+    fetch_remote_refs([GIT_TEST_DIR])
+    assert check_if_remote_branch_exists(GIT_TEST_DIR, 'master')
+
+    execute(['git', 'tag', '-a', 'v1.0.0', '-m', 'Release'], cwd=GIT_TEST_DIR)
+    execute(['git', 'push', 'origin', 'v1.0.0'], cwd=GIT_TEST_DIR)
+    assert not check_if_remote_tag_exists(GIT_TEST_DIR, 'v1.0.0')  # cached for the run
+
+    clear_remote_refs_cache()
+    assert check_if_remote_tag_exists(GIT_TEST_DIR, 'v1.0.0')
+    assert get_remote_tags(GIT_TEST_DIR) == ['v1.0.0']
+    assert not check_if_remote_branch_exists(GIT_TEST_DIR, '1.0.1')
+
+    execute(['git', 'remote', 'set-url', 'origin', str(tmp_path / 'missing.git')], cwd=GIT_TEST_DIR)
+    clear_remote_refs_cache()
+    fetch_remote_refs([GIT_TEST_DIR])  # reported, not raised
+    with pytest.raises(subprocess.CalledProcessError):
+        get_remote_tags(GIT_TEST_DIR)
+    with pytest.raises(subprocess.CalledProcessError):
+        get_remote_tags(GIT_TEST_DIR)  # failures are not cached
+
+def test_create_branch_from_remote(tmp_path):
+    """Test create_branch tracks an existing remote branch."""
+    create_remote(tmp_path / 'remote.git')
+    create_branch(GIT_TEST_DIR, 'test')
+    create_file(GIT_TEST_DIR / 'test_file', 'test')
+    add_files_to_stage(GIT_TEST_DIR)
+    commit_all(GIT_TEST_DIR, 'Test commit')
+    execute(['git', 'push', 'origin', 'test'], cwd=GIT_TEST_DIR)
+    switch_branch(GIT_TEST_DIR, 'master')
+    clear_remote_refs_cache()
+
+    create_branch(GIT_TEST_DIR, 'test')
+    assert get_branch(GIT_TEST_DIR) == 'test'
+    assert (GIT_TEST_DIR / 'test_file').exists()
+    clear_remote_refs_cache()
+
+def test_simulate():
+    """Test simulate."""
+    create_project('1.0.0', '1.0.0')
+    add_files_to_stage(GIT_TEST_DIR)
+    commit_all(GIT_TEST_DIR, 'Test commit')
+    init_file = GIT_TEST_DIR / 'src' / GIT_DIR / '__init__.py'
+
+    with simulate() as simulation:
+        update_version(GIT_DIR, '1.0.1')
+        assert str(get_plugin_version(GIT_DIR)) == '1.0.1'
+        create_branch(GIT_TEST_DIR, '1.0.1')
+        assert get_branch(GIT_TEST_DIR) == '1.0.1'
+        assert check_if_branch_exists(GIT_TEST_DIR, '1.0.1')
+        commit_all(GIT_TEST_DIR, 'Bump version')
+        undo_update(GIT_DIR)
+        assert str(get_plugin_version(GIT_DIR)) == '1.0.0'
+        update_version(GIT_DIR, '1.0.2')
+
+    assert init_file.read_text() == "__version__ = '1.0.0'\n"
+    assert get_branch(GIT_TEST_DIR) == 'master'
+    assert not check_if_branch_exists(GIT_TEST_DIR, '1.0.1')
+    diffs = list(simulation.get_diffs())
+    assert f'--- a/{GIT_DIR}/src/{GIT_DIR}/__init__.py\n' in diffs
+    assert "+__version__ = '1.0.2'\n" in diffs
+    changes = list(simulation.get_ref_changes())
+    assert f'{GIT_TEST_DIR}: create 1.0.1 at simulated-commit-1' in changes
+    assert len(changes) == 1
+
+def test_create_branch_from_remote_with_changes(tmp_path):
+    """Test create_branch carries uncommitted changes onto an existing remote branch."""
+    create_project('1.0.0', '1.0.0')
+    add_files_to_stage(GIT_TEST_DIR)
+    commit_all(GIT_TEST_DIR, 'Test commit')
+    create_remote(tmp_path / 'remote.git')
+    create_branch(GIT_TEST_DIR, '1.0.1')
+    create_project('1.0.1', '1.0.0')
+    add_files_to_stage(GIT_TEST_DIR)
+    commit_all(GIT_TEST_DIR, 'Bump version')
+    execute(['git', 'push', 'origin', '1.0.1'], cwd=GIT_TEST_DIR)
+    switch_branch(GIT_TEST_DIR, 'master')
+    delete_branch(GIT_TEST_DIR, '1.0.1')
+    clear_remote_refs_cache()
+
+    create_project('1.0.1', '1.0.0')
+    create_file(GIT_TEST_DIR / 'initial_file', 'another_test')
+    assert create_branch(GIT_TEST_DIR, '1.0.1')
+    assert get_branch(GIT_TEST_DIR) == '1.0.1'
+    execute(['git', 'merge-base', '--is-ancestor', 'origin/1.0.1', 'HEAD'], cwd=GIT_TEST_DIR)
+    assert execute(['git', 'rev-parse', 'HEAD'], cwd=GIT_TEST_DIR) == execute(['git', 'rev-parse', 'origin/1.0.1'], cwd=GIT_TEST_DIR)
+    assert get_modified_files(GIT_TEST_DIR) == ['initial_file']
+    assert execute(['git', 'stash', 'list'], cwd=GIT_TEST_DIR) == ''
+
+    switch_branch(GIT_TEST_DIR, 'master')
+    create_project('1.0.2', '1.0.0')
+    assert not create_branch(GIT_TEST_DIR, '1.0.1')
+    assert get_branch(GIT_TEST_DIR) == 'master'
+    assert not check_if_branch_exists(GIT_TEST_DIR, '1.0.1')
+    assert str(get_plugin_version(GIT_DIR)) == '1.0.2'
+    assert execute(['git', 'stash', 'list'], cwd=GIT_TEST_DIR) == ''
+    clear_remote_refs_cache()
+
+def test_classify_removed_dependency():
+    """Test classify_changes with a removed requirement."""
+    create_project('1.0.0', '1.0.0', extra='    "requests>=2.0",\n')
+    add_files_to_stage(GIT_TEST_DIR)
+    commit_all(GIT_TEST_DIR, 'Test commit')
+    create_project('1.0.0', '1.0.0')
+    assert classify_changes(GIT_DIR) == Change.SUBSTANTIVE
+
+    create_project('1.0.1', '1.0.0', extra='    "requests>=2.1",\n')
+    assert classify_changes(GIT_DIR) == Change.DEPENDENCY_ONLY
+
+def test_classify_changes_simulated():
+    """Test classify_changes reads the simulation overlay."""
+    create_project('1.0.0', '1.0.0')
+    add_files_to_stage(GIT_TEST_DIR)
+    commit_all(GIT_TEST_DIR, 'Test commit')
+    create_project('1.0.1', '1.0.0')
+    assert classify_changes(GIT_DIR) == Change.VERSION_ONLY
+
+    with simulate():
+        undo_update(GIT_DIR)
+        assert classify_changes(GIT_DIR) == Change.UNTOUCHED
+        update_version(GIT_DIR, '1.0.2')
+        assert classify_changes(GIT_DIR) == Change.VERSION_ONLY
+        create_file(GIT_TEST_DIR / 'initial_file', 'another_test')
+        assert classify_changes(GIT_DIR) == Change.SUBSTANTIVE
+
+    execute(['git', 'checkout', 'initial_file'], cwd=GIT_TEST_DIR)
+    create_project('1.0.0', '1.0.0')
+    assert classify_changes(GIT_DIR) == Change.UNTOUCHED
+    (GIT_TEST_DIR / 'pyproject.toml').unlink()
+    assert classify_changes(GIT_DIR) == Change.SUBSTANTIVE
+    with simulate():
+        assert classify_changes(GIT_DIR) == Change.SUBSTANTIVE
+
+def test_update_version_keeps_line_separators():
+    """Test update_version only splits lines on newlines."""
+    create_project('1.0.0', '1.0.0', code='SEPARATORS = "\x0c\x1c\x85\u2028"\n')
+    update_version(GIT_DIR, '1.0.1')
+    init_file = GIT_TEST_DIR / 'src' / GIT_DIR / '__init__.py'
+    assert init_file.read_text() == 'SEPARATORS = "\x0c\x1c\x85\u2028"\n__version__ = \'1.0.1\'\n'
@@ -5,13 +5,16 @@ from argparse import ArgumentParser, Namespace
 from pathlib import Path
 
 from lib.git import (
+    Change,
     add_files_to_stage,
     check_if_branch_exists,
-    checkout_branch,
+    classify_plugins,
     commit_all,
     create_branch,
+    fetch_remote_refs,
     get_all_files,
     get_branch,
+    switch_branch,
 )
 from plugins import get_datoso_version, get_plugin_version, plugin_list
 
@@ -58,12 +61,12 @@ def main() -> None:
     if args.plugin:
         plugins = [args.plugin]
 
+    changes = classify_plugins(plugins)
+    fetch_remote_refs(plugin for plugin in plugins if changes[plugin] == Change.SUBSTANTIVE)
     for plugin in plugins:
-        modified_files = get_all_files(plugin)
-        if not modified_files \
-            or modified_files == ['pyproject.toml'] \
-            or modified_files == ['pyproject.toml', str(Path('src') / plugin / '__init__.py')]:
+        if changes[plugin] != Change.SUBSTANTIVE:
             continue
+        modified_files = get_all_files(plugin)
         version = get_plugin_version(plugin)
         branch = get_branch(plugin)
         if str(Path('src') / plugin / '__init__.py') not in modified_files:
@@ -77,10 +80,11 @@ def main() -> None:
                 if input('y/n: ').lower() != 'y':
                     continue
         if str(version) != branch:
-            if not check_if_branch_exists(plugin, version):
-                create_branch(plugin, str(version))
+            if not check_if_branch_exists(plugin, str(version)):
+                if not create_branch(plugin, str(version)):
+                    continue
             else:
-                checkout_branch(plugin, version)
+                switch_branch(plugin, str(version))
 
         print(f'{plugin} was updated with version {version}, do you want to create a pull request?')
         if input('y/n: ').lower() != 'y':
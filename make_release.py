@@ -2,10 +2,14 @@
 """Create a Release."""
 import sys
 from argparse import ArgumentParser, Namespace
+from contextlib import suppress
+from pathlib import Path
 
 import requests
+from lib.build import WHEELHOUSE, WheelhouseError, verify_plugins
 from lib.config import config
-from packaging.version import Version
+from lib.git import check_if_remote_tag_exists, fetch_remote_refs, get_remote_tags
+from packaging.version import InvalidVersion, Version
 
 from datoso_dev_updater.lib.plugins import get_plugin_version, plugin_list
 
@@ -33,6 +37,11 @@ def parse_args() -> Namespace:
     release_parser.add_argument('-l', '--latest', help='Make latest version', action='store_true')
     release_parser.add_argument('-d', '--draft', help='Draft release', action='store_true')
 
+    parser.add_argument('--skip-build', help='Do not build and verify the plugins before releasing', action='store_true')
+    parser.add_argument('-j', '--jobs', help='Parallel builds', type=int, default=None)
+    parser.add_argument('--wheelhouse', help='Directory with the wheels of the third-party dependencies',
+                        type=Path, default=WHEELHOUSE)
+
     parser.add_argument('--dry-run', help='Dry run', action='store_true')
 
     return parser.parse_args()
@@ -82,10 +91,20 @@ def create_release(args: Namespace, plugin: str) -> dict:
     response.raise_for_status()
     return response.json()
 
-def is_new_version_valid(args: Namespace, plugin: Version) -> bool:
+def get_tag_version(plugin: str) -> Version | None:
+    """Get latest version from the tags on the remote."""
+    versions = []
+    for tag in get_remote_tags(plugin):
+        with suppress(InvalidVersion):
+            versions.append(Version(tag))
+    return max(versions, default=None)
+
+def is_new_version_valid(args: Namespace, plugin: str) -> bool:
     """Validate version."""
     new_version = get_plugin_version(plugin)
-    current_version = get_release_version(args, plugin)
+    if check_if_remote_tag_exists(plugin, f'v{new_version}'):
+        return False
+    current_version = get_tag_version(plugin) or get_release_version(args, plugin)
     # if new_version <= current_version:
     #     raise ValueError(f'New version {new_version} is less than or equal to the current version {current_version}')
     return new_version > current_version
@@ -93,10 +112,24 @@ def is_new_version_valid(args: Namespace, plugin: Version) -> bool:
 if __name__ == '__main__':
     args = parse_args()
     plugins = list(plugin_list) if args.automatic or args.all else [args.plugin]
+    fetch_remote_refs(plugins)
 
+    releases = []
     for plugin in plugins:
         if is_new_version_valid(args, plugin):
-            create_release(args, plugin)
+            releases.append(plugin)
         else:
             print(f'New version is not valid for {plugin}')
+
+    if not args.skip_build:
+        # datoso goes first so the plugins are verified against the fresh build of their datoso>= pins
+        try:
+            results = verify_plugins(dict.fromkeys(['datoso', *releases]), wheelhouse=args.wheelhouse, max_workers=args.jobs)
+        except WheelhouseError as e:
+            print(e)
+            sys.exit(1)
+        releases = [plugin for plugin in releases if not results[plugin]['error']]
+
+    for plugin in releases:
+        create_release(args, plugin)
     print('Done')
@@ -1,9 +1,12 @@
 #!/usr/bin/env python
 """Update the version of datoso plugins and seeds."""
 
+import subprocess
+
 import typer
-from lib.git import create_branch, get_modified_files, get_new_files, undo_update
+from lib.git import Change, classify_plugins, create_branch, fetch_remote_refs, get_all_files, undo_update
 from lib.plugins import get_datoso_version, get_plugin_version, plugin_list, update_dependencies, update_version
+from lib.simulation import simulate
 from packaging.version import Version
 from rich.console import Console
 from typing_extensions import Annotated
@@ -84,38 +87,52 @@ def main(
         console.print(f'[red]Plugin {plugin} not found[/red]')
         raise typer.Exit(1)
 
-    def update_plugin(plugin: str) -> None:
-        actual_version, new_version = get_new_version(plugin, patch=patch, minor=minor, major=major, version=version, dev=dev)
-        update_version(plugin, new_version, dry_run=dry_run)
-        console.print(f'[green]Updated version files [cyan]{plugin}[/cyan] from [blue]{actual_version}[/blue] to [magenta]{new_version}[/magenta][/green]')
-        #create a branch for the update with branch name = new version
-        create_branch(plugin, str(new_version), dry_run=dry_run)
-        console.print(f'[green]Created branch [cyan]{plugin}[/cyan] for version [magenta]{new_version}[/magenta][/green]')
-
-    datoso_version = get_datoso_version()
+    def run() -> None:
+        def update_plugin(plugin: str) -> None:
+            actual_version, new_version = get_new_version(plugin, patch=patch, minor=minor, major=major, version=version, dev=dev)
+            update_version(plugin, new_version)
+            console.print(f'[green]Updated version files [cyan]{plugin}[/cyan] from [blue]{actual_version}[/blue] to [magenta]{new_version}[/magenta][/green]')
+            #create a branch for the update with branch name = new version
+            try:
+                if not create_branch(plugin, str(new_version)):
+                    return
+            except subprocess.CalledProcessError as e:
+                console.print(f'[red]Could not create branch [cyan]{new_version}[/cyan] for [cyan]{plugin}[/cyan][/red]')
+                console.print(e.output or e.stderr, markup=False, highlight=False)
+                return
+            console.print(f'[green]Created branch [cyan]{plugin}[/cyan] for version [magenta]{new_version}[/magenta][/green]')
+
+        datoso_version = get_datoso_version()
+
+        if automatic or all_:
+            for plg in plugin_list:
+                undo_update(plg)
+            changes = {} if restore else classify_plugins(plugin_list)
+            bumped = [plg for plg, change in changes.items() if change == Change.SUBSTANTIVE or all_]
+            # Query the remotes of the plugins that get a version branch in one concurrent pass
+            fetch_remote_refs(bumped)
+            for plg, change in changes.items():
+                if plg in bumped:
+                    console.print(f'Plugin [cyan]{plg}[/cyan] ([yellow]{change.value}[/yellow])')
+                    console.print('[yellow]Files:[/yellow]')
+                    console.print(get_all_files(plg))
+                    update_plugin(plg)
+        elif restore:
+            undo_update(plugin)
+        else:
+            update_plugin(plugin)
 
-    if automatic or all_:
         for plg in plugin_list:
-            undo_update(plg)
-            if restore:
-                continue
-
-            newfiles = get_new_files(plg)
-            modified = get_modified_files(plg)
-            all_files = [x for x in newfiles + modified if x]
-            if all_files or all_:
-                console.print(f'Plugin [cyan]{plg}[/cyan]')
-                console.print('[yellow]Files:[/yellow]')
-                console.print(all_files)
-                update_plugin(plg)
-    elif restore:
-        undo_update(plugin)
+            if 'plugin' not in plg or plg == plugin:
+                update_dependencies(plg, datoso_version, plugin_list)
+
+    if dry_run:
+        # Apply every edit and git operation to an in-memory overlay, then show the result
+        with simulate() as simulation:
+            run()
+        simulation.print_report()
     else:
-        update_plugin(plugin)
-
-    for plg in plugin_list:
-        if 'plugin' not in plg or plg == plugin:
-            update_dependencies(plg, datoso_version, plugin_list, dry_run=dry_run)
+        run()
 
 
 if __name__ == '__main__':